@@ -0,0 +1,43 @@
+"""
+Helpers shared between the download scripts and check_pdfs.py
+"""
+
+import os
+
+# paths already known to hold valid PDFs this run — a download that was
+# validated while streaming in never gets re-read from disk
+_cache = {}
+
+def is_pdf(filepath):
+    """Check if file is actually a PDF"""
+    key = str(filepath)
+    if _cache.get(key):
+        return True
+    # os.open + pread skips the io.BufferedReader setup that open() pays
+    # for — we only ever want 4 bytes
+    try:
+        if hasattr(os, "pread"):
+            fd = os.open(filepath, os.O_RDONLY)
+            try:
+                valid = os.pread(fd, 4, 0) == b'%PDF'
+            finally:
+                os.close(fd)
+        else:
+            # Windows has no pread; the buffered path works everywhere
+            with open(filepath, 'rb') as f:
+                valid = f.read(4) == b'%PDF'
+    except OSError:
+        return False
+    if valid:
+        # only positive results are remembered; a failed file may be
+        # re-downloaded and must be re-checked
+        _cache[key] = True
+    return valid
+
+def known_pdf(filepath):
+    """True if filepath was already validated as a PDF this run"""
+    return bool(_cache.get(str(filepath)))
+
+def remember_pdf(filepath):
+    """Record that filepath was just written and validated as a PDF"""
+    _cache[str(filepath)] = True
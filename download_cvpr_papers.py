@@ -1,212 +1,371 @@
-import requests, os, re, time, json, argparse
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from pathlib import Path
-
-# quick filename cleanup
-def fix_name(txt):
-    txt = re.sub(r'[<>:"/\\|?*]', '', txt)  
-    txt = re.sub(r'\s+', ' ', txt).strip()
-    return txt[:200]  
-
-def is_pdf(filepath):
-    """Check if file is actually a PDF"""
-    try:
-        with open(filepath, 'rb') as f:
-            header = f.read(4)
-            return header == b'%PDF'
-    except:
-        return False
-
-def find_pdf_url(paper_url, session):
-    """Visit paper page and find the PDF download link"""
-    try:
-        response = session.get(paper_url, timeout=30)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Look for PDF links
-        pdf_links = soup.find_all('a', href=re.compile(r'\.pdf$', re.IGNORECASE))
-        
-        for link in pdf_links:
-            href = link.get('href')
-            if href:
-                return urljoin(paper_url, href)
-        
-        # Alternative: look for links with "pdf" text
-        for link in soup.find_all('a'):
-            if link.get_text().strip().lower() == 'pdf':
-                href = link.get('href')
-                if href:
-                    return urljoin(paper_url, href)
-        
-        return None
-    except Exception as e:
-        print(f"   error finding PDF: {e}")
-        return None
-
-def grab_file(url, path, session):
-    try:
-        r = session.get(url, stream=True, timeout=30)
-        r.raise_for_status()
-        
-        # Check content type
-        content_type = r.headers.get('content-type', '').lower()
-        if 'pdf' not in content_type:
-            print(f"   warning: content-type is '{content_type}'")
-        
-        total = int(r.headers.get('content-length', 0))
-        done = 0
-        
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(8192):
-                if not chunk: continue
-                f.write(chunk)
-                if total:
-                    done += len(chunk)
-                    pct = done * 100 / total
-                    print(f"\r   ... {pct:.1f}%", end="")
-        
-        # Validate the downloaded file is actually a PDF
-        if not is_pdf(path):
-            print("\r   failed: not a valid PDF file")
-            return False
-            
-        # Check file size is reasonable
-        if path.stat().st_size < 1024:
-            print("\r   failed: file too small")
-            return False
-            
-        print("\r   ✓ downloaded")
-        return True
-    except Exception as e:
-        print(f"   failed: {e}")
-        return False
-
-def load_log(logf):
-    if logf.exists():
-        try:
-            return json.load(open(logf, "r", encoding="utf-8"))
-        except:
-            return {}
-    return {}
-
-def save_log(logf, data):
-    with open(logf, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--retry-failed", action="store_true")
-    ap.add_argument("--max-retries", type=int, default=3)
-    args = ap.parse_args()
-
-    base = "https://openaccess.thecvf.com/CVPR2024?day=2024-06-19"
-    outdir = Path("cvpr_2024_papers")
-    outdir.mkdir(exist_ok=True)
-
-    flog = outdir / "failed.json"
-    failed = load_log(flog)
-
-    s = requests.Session()
-    s.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    })
-
-    # if retrying failed
-    if args.retry_failed and failed:
-        todo = list(failed.items())
-        print(f"Retrying {len(todo)} failed downloads...")
-    else:
-        print("Fetching paper list...")
-        try:
-            r = s.get(base, timeout=60)
-            r.raise_for_status()
-        except Exception as e:
-            print("Could not fetch main page:", e)
-            return
-        
-        soup = BeautifulSoup(r.content, "html.parser")
-        dt_elements = soup.select("#content > dl > dt")
-        print(f"Found {len(dt_elements)} papers")
-
-        todo = []
-        for dt in dt_elements:
-            title_link = dt.find("a")
-            if not title_link: 
-                continue
-            
-            title = title_link.get_text().strip()
-            paper_page_url = urljoin(base, title_link.get("href"))
-            
-            # Store paper page URL, we'll find PDF URL later
-            todo.append((title, paper_page_url))
-
-    done, bad = 0, 0
-    new_failed = {}
-
-    for i, (title, paper_page_url) in enumerate(todo, 1):
-        print(f"\n{i}/{len(todo)} {title}")
-        fname = outdir / (fix_name(title) + ".pdf")
-
-        if fname.exists() and fname.stat().st_size > 1024 and is_pdf(fname):
-            print("   ✓ already exists (valid PDF)")
-            failed.pop(title, None)
-            continue
-
-        # If retrying failed, use stored PDF URL, otherwise find it
-        if args.retry_failed and title in failed:
-            pdf_url = failed[title]
-            print(f"   → using stored PDF URL")
-        else:
-            print(f"   → finding PDF link...")
-            pdf_url = find_pdf_url(paper_page_url, s)
-            if not pdf_url:
-                print("   ✗ no PDF link found")
-                bad += 1
-                new_failed[title] = paper_page_url  # Store paper page for retry
-                continue
-
-        print(f"   → downloading PDF...")
-        success = False
-        for attempt in range(args.max_retries):
-            if attempt: 
-                print(f"   → retry {attempt+1}/{args.max_retries}")
-                time.sleep(2)
-            
-            if grab_file(pdf_url, fname, s):
-                done += 1
-                failed.pop(title, None)
-                success = True
-                break
-            else:
-                if fname.exists(): 
-                    fname.unlink()
-
-        if not success:
-            bad += 1
-            new_failed[title] = pdf_url  # Store actual PDF URL for retry
-
-        time.sleep(0.5)
-
-    if new_failed or (args.retry_failed and failed):
-        failed.update(new_failed)
-        save_log(flog, failed)
-    elif flog.exists():
-        flog.unlink()
-
-    print("\n==== SUMMARY ====")
-    print("downloaded:", done)
-    print("failed:", bad)
-    print("saved in:", outdir.absolute())
-    if bad:
-        print("failed ones logged in:", flog)
-
-if __name__ == "__main__":
-    main()
+import requests, os, io, re, shutil, sys, time, json, argparse, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from lxml import etree
+from urllib.parse import urljoin
+from pathlib import Path
+
+from cvpr_utils import is_pdf, remember_pdf
+
+# orjson serializes in C and is several times faster than stdlib json;
+# fall back if it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# quick filename cleanup — patterns compiled once at import instead of
+# hitting the re module cache on every call
+_BAD = re.compile(r'[<>:"/\\|?*]')
+_WS = re.compile(r'\s+')
+
+def fix_name(txt):
+    return _WS.sub(' ', _BAD.sub('', txt)).strip()[:200]
+
+def paper_pdf_url(page_url):
+    """PDF URLs mirror paper-page URLs on openaccess.thecvf.com"""
+    return page_url.replace("/html/", "/papers/").replace(".html", ".pdf")
+
+def parse_index(content, base):
+    """Stream (title, PDF URL) pairs out of the index page.
+
+    iterparse never materializes the full DOM, so peak memory stays small
+    and the first papers are available before parsing finishes. The PDF
+    link is taken straight from the <dd> block under each title, so no
+    per-paper page fetch is needed.
+    """
+    pending = None  # (title, paper page URL) awaiting its pdf link
+    for _, elem in etree.iterparse(io.BytesIO(content), events=("end",),
+                                   tag=("dt", "dd"), html=True):
+        if elem.tag == "dt":
+            if pending:
+                # no pdf link in the previous paper's <dd>s; the CVF URL
+                # scheme is fixed, so derive it from the page URL
+                yield pending[0], paper_pdf_url(pending[1])
+            pending = None
+            link = elem.find("a")
+            if link is not None and link.get("href"):
+                title = "".join(link.itertext()).strip()
+                pending = (title, urljoin(base, link.get("href")))
+        elif pending:
+            for link in elem.iter("a"):
+                href = link.get("href") or ""
+                if href.lower().endswith(".pdf"):
+                    yield pending[0], urljoin(base, href)
+                    pending = None
+                    break
+        # classic iterparse pattern: drop handled elements to keep the
+        # partial tree tiny
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    if pending:
+        yield pending[0], paper_pdf_url(pending[1])
+
+class _Progress:
+    """Wraps a raw response stream and reports download progress.
+
+    Updates go straight to stdout at most every quarter second — the old
+    per-chunk print could flush thousands of times per file and became
+    the bottleneck on fast links.
+    """
+    def __init__(self, raw, total, done=0):
+        self.raw = raw
+        self.total = total
+        self.done = done
+        self.last = 0.0
+
+    def read(self, n=-1):
+        chunk = self.raw.read(n)
+        self.done += len(chunk)
+        now = time.monotonic()
+        if now - self.last > 0.25:
+            self.last = now
+            if self.total:
+                sys.stdout.write(f"\r   ... {self.done * 100 / self.total:.1f}%")
+            else:
+                sys.stdout.write(f"\r   ... {self.done // 1024} KB")
+            sys.stdout.flush()
+        return chunk
+
+def grab_file(url, path, session, label="", progress=True):
+    # download to a .part sidecar and rename on success, so interrupted
+    # transfers can resume with a Range request instead of restarting.
+    # label prefixes diagnostics so messages from concurrent workers stay
+    # attributable; success is reported by the caller, not here.
+    part = path.with_name(path.name + ".part")
+    try:
+        start = part.stat().st_size if part.exists() else 0
+
+        # PDFs are already compressed; asking for identity avoids the server
+        # wasting CPU gzipping binary content
+        headers = {"Accept-Encoding": "identity"}
+        if start:
+            headers["Range"] = f"bytes={start}-"
+        r = session.get(url, stream=True, timeout=30, headers=headers)
+
+        # back off when the server asks us to; the retry loop in the
+        # caller will take another attempt afterwards
+        if r.status_code in (429, 503):
+            retry_after = r.headers.get("Retry-After", "1")
+            try:
+                delay = float(retry_after)
+            except ValueError:  # Retry-After may be an HTTP date
+                delay = 5.0
+            print(f"   {label}server busy (HTTP {r.status_code}), waiting {delay:.0f}s")
+            time.sleep(delay)
+            return False
+
+        # a stale .part — a complete file left by a crash before the
+        # rename, or the remote file changed size — makes the Range
+        # request fail with 416; clear it instead of failing this paper
+        # on every future attempt
+        if start and 400 <= r.status_code < 500:
+            if r.status_code == 416 and part.stat().st_size > 1024:
+                with open(part, 'rb') as pf:
+                    if pf.read(4) == b'%PDF':
+                        # the .part is already the whole file
+                        part.replace(path)
+                        remember_pdf(path)
+                        return True
+            part.unlink(missing_ok=True)
+            return grab_file(url, path, session, label, progress)  # retry from byte 0
+
+        r.raise_for_status()
+        
+        # Check content type
+        content_type = r.headers.get('content-type', '').lower()
+        if 'pdf' not in content_type:
+            print(f"   {label}warning: content-type is '{content_type}'")
+        
+        # server may ignore Range and answer 200 — then start over
+        resuming = start and r.status_code == 206
+
+        # unbuffered: copyfileobj already hands us 1 MB chunks, so the
+        # BufferedWriter layer would only add a memcpy per chunk
+        with open(part, "ab" if resuming else "wb", buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                # tell the kernel this is a straight sequential write so it
+                # can use larger write-behind
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            r.raw.decode_content = True
+            if not resuming:
+                # peek the magic bytes off the stream so validation needs no
+                # re-open after download — and a bad response (e.g. an HTML
+                # error page) is rejected before transferring the whole body
+                header = r.raw.read(4)
+                if header != b'%PDF':
+                    print(f"   {label}failed: not a valid PDF file")
+                    part.unlink(missing_ok=True)
+                    return False
+                f.write(header)
+            # no progress display when piped to a file or another tool,
+            # or when concurrent workers would fight over the same line
+            src = r.raw
+            if progress and sys.stdout.isatty():
+                total = int(r.headers.get('content-length', 0) or 0)
+                if resuming:
+                    total += start
+                src = _Progress(r.raw, total, start if resuming else 4)
+            # drain the rest through shutil's C copy loop in 1 MB chunks
+            # instead of a Python-level 8 KB iter_content loop
+            shutil.copyfileobj(src, f, length=1024 * 1024)
+        if src is not r.raw:
+            sys.stdout.write("\r")
+        
+        # resumed partials never had their header checked in this attempt
+        if resuming and not is_pdf(part):
+            print(f"   {label}failed: not a valid PDF file")
+            part.unlink(missing_ok=True)
+            return False
+
+        # Check file size is reasonable
+        if part.stat().st_size < 1024:
+            print(f"   {label}failed: file too small")
+            part.unlink(missing_ok=True)
+            return False
+            
+        part.replace(path)
+        remember_pdf(path)
+        if hasattr(os, "posix_fadvise"):
+            # the PDF is write-once — validation already happened inline —
+            # so release its pages rather than evicting hotter data
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+        return True
+    except Exception as e:
+        print(f"   {label}failed: {e}")
+        return False
+
+def load_log(logf):
+    if logf.exists():
+        try:
+            if orjson is not None:
+                return orjson.loads(logf.read_bytes())
+            with open(logf, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+    return {}
+
+def save_log(logf, data):
+    if orjson is not None:
+        logf.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with open(logf, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def load_done(logf):
+    if logf.exists():
+        try:
+            if orjson is not None:
+                return set(orjson.loads(logf.read_bytes()))
+            with open(logf, "r", encoding="utf-8") as f:
+                return set(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            return set()
+    return set()
+
+def save_done(logf, done_set):
+    save_log(logf, sorted(done_set))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--retry-failed", action="store_true")
+    ap.add_argument("--max-retries", type=int, default=3)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--and-check", action="store_true")
+    args = ap.parse_args()
+
+    base = "https://openaccess.thecvf.com/CVPR2024?day=2024-06-19"
+    outdir = Path("cvpr_2024_papers")
+    outdir.mkdir(exist_ok=True)
+
+    flog = outdir / "failed.json"
+    failed = load_log(flog)
+
+    # titles already downloaded and validated on earlier runs; checking
+    # this set first skips the exists/stat/header syscalls per paper
+    clog = outdir / "completed.json"
+    completed = load_done(clog)
+
+    s = requests.Session()
+    s.headers.update({
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.5",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Connection": "keep-alive",
+        "Upgrade-Insecure-Requests": "1",
+    })
+
+    # size the urllib3 pool to the worker count so every thread reuses a
+    # kept-alive connection instead of opening (and discarding) its own
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=4, pool_maxsize=max(args.concurrency, 10))
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+
+    # if retrying failed
+    if args.retry_failed and failed:
+        todo = [(t, u, outdir / (fix_name(t) + ".pdf"))
+                for t, u in failed.items()]
+        print(f"Retrying {len(todo)} failed downloads...")
+    else:
+        print("Fetching paper list...")
+        try:
+            r = s.get(base, timeout=60)
+            r.raise_for_status()
+        except Exception as e:
+            print("Could not fetch main page:", e)
+            return
+        
+        # parse_index is lazy, so downloads start while it still runs;
+        # target filenames are computed once here rather than per attempt
+        todo = ((t, u, outdir / (fix_name(t) + ".pdf"))
+                for t, u in parse_index(r.content, base))
+
+    done, bad = 0, 0
+    new_failed = {}
+    lock = threading.Lock()  # guards failed/new_failed across workers
+
+    def download_one(title, pdf_url, fname):
+        if title in completed:
+            return "already exists (valid PDF)"
+
+        if fname.exists() and fname.stat().st_size > 1024 and is_pdf(fname):
+            with lock:
+                completed.add(title)
+                failed.pop(title, None)
+            return "already exists (valid PDF)"
+
+        # older failed.json entries stored the paper page URL
+        if pdf_url.lower().endswith(".html"):
+            pdf_url = paper_pdf_url(pdf_url)
+
+        for attempt in range(args.max_retries):
+            if attempt:
+                time.sleep(2)
+
+            if grab_file(pdf_url, fname, s, label=f"{title}: ",
+                         progress=args.concurrency == 1):
+                with lock:
+                    completed.add(title)
+                    failed.pop(title, None)
+                    # checkpoint so a killed run keeps most of its progress
+                    if len(completed) % 50 == 0:
+                        save_done(clog, completed)
+                return "downloaded"
+
+        with lock:
+            new_failed[title] = pdf_url  # Store actual PDF URL for retry
+        return "failed"
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        # submitting while parse_index streams overlaps index parsing
+        # with the first downloads
+        futures = {ex.submit(download_one, t, u, f): t for t, u, f in todo}
+        total = len(futures)
+        print(f"Downloading {total} papers")
+        for i, fut in enumerate(as_completed(futures), 1):
+            title = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                result = f"failed: {e}"
+            print(f"{i}/{total} {title}")
+            if result == "downloaded":
+                done += 1
+                print("   ✓ downloaded")
+            elif result == "already exists (valid PDF)":
+                print("   ✓ already exists (valid PDF)")
+            else:
+                bad += 1
+                print(f"   ✗ {result}")
+
+    if completed:
+        save_done(clog, completed)
+
+    if new_failed or (args.retry_failed and failed):
+        failed.update(new_failed)
+        save_log(flog, failed)
+    elif flog.exists():
+        flog.unlink()
+
+    if args.and_check:
+        print("\nValidating downloaded PDFs...")
+        import check_pdfs
+        check_pdfs.check_dir(outdir)
+
+    print("\n==== SUMMARY ====")
+    print("downloaded:", done)
+    print("failed:", bad)
+    print("saved in:", outdir.absolute())
+    if bad:
+        print("failed ones logged in:", flog)
+
+if __name__ == "__main__":
+    main()